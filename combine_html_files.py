@@ -1,6 +1,7 @@
 import os
 from bs4 import BeautifulSoup
 from urllib.parse import unquote
+import supervisor
 
 def natural_key(s):
     parts = []
@@ -176,16 +177,12 @@ def combine_html_files(folder_path, html_files, base_soup, insert_chapter_marker
             if inner_content.strip():
                 fragment = BeautifulSoup(inner_content, 'html.parser')
                 body.extend(list(fragment.children))
+        except MemoryError:
+            raise
         except Exception as e:
             print(f"Error processing {filename}: {e}")
 
-def main():
-    folder_path = input('Enter the folder path (default "input"): ').strip().strip('"\'') or 'input'
-    if not os.path.isdir(folder_path):
-        print("The path is not a valid folder.")
-        return
-    marker_input = input('Insert chapter markers before headings? (y/N): ').strip().lower()
-    insert_chapter_markers = marker_input == 'y'
+def combine_folder(folder_path, insert_chapter_markers=False):
     output_file = folder_path + "_output.html"
     html_files, stopped_due_to_mismatch = determine_file_order(folder_path)
     if stopped_due_to_mismatch:
@@ -199,10 +196,37 @@ def main():
         print("Could not read any HTML files.")
         return
     combine_html_files(folder_path, html_files, base_soup, insert_chapter_markers)
-    with open(output_file, 'w', encoding='utf-8') as out:
-        out.write(base_soup.prettify())
+    combined = base_soup.prettify()
+    partial_file = output_file + '.part'
+    with open(partial_file, 'w', encoding='utf-8') as out:
+        out.write(combined)
+    os.replace(partial_file, output_file)
     print(f"Combined HTML saved to {output_file}")
 
+def remove_partial_output(folder_path, insert_chapter_markers=False):
+    partial_file = folder_path + "_output.html.part"
+    if os.path.exists(partial_file):
+        os.remove(partial_file)
+
+def main():
+    folder_path = input('Enter the folder path (default "input"): ').strip().strip('"\'') or 'input'
+    if not os.path.isdir(folder_path):
+        print("The path is not a valid folder.")
+        return
+    marker_input = input('Insert chapter markers before headings? (y/N): ').strip().lower()
+    insert_chapter_markers = marker_input == 'y'
+    book_folders = sorted((f for f in os.listdir(folder_path) if os.path.isdir(os.path.join(folder_path, f))), key=natural_key)
+    if book_folders and not get_all_html_files(folder_path):
+        print(f"Combining {len(book_folders)} book folder{'s' if len(book_folders) > 1 else ''} with per-book limits")
+        supervisor.run_batch(
+            combine_folder,
+            [(os.path.join(folder_path, f), insert_chapter_markers) for f in book_folders],
+            book_folders,
+            quarantine_path=folder_path + "_quarantine.jsonl",
+            cleanup=remove_partial_output,
+        )
+        return
+    combine_folder(folder_path, insert_chapter_markers)
+
 if __name__ == "__main__":
     main()
-
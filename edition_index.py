@@ -0,0 +1,107 @@
+import hashlib
+import heapq
+import html
+import os
+import re
+import sqlite3
+
+default_index_path = "./output/editions.sqlite"
+
+SKETCH_SIZE = 128
+SHINGLE_WORDS = 5
+DUPLICATE_SIMILARITY = 0.8
+TAG_PATTERN = re.compile(r'<(script|style)\b.*?</\1\s*>|<[^>]+>', re.DOTALL | re.IGNORECASE)
+WORD_PATTERN = re.compile(r'\w+')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS editions (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    output_path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sketch_values (
+    edition_id INTEGER NOT NULL REFERENCES editions(id),
+    value INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sketch_values_value ON sketch_values(value);
+CREATE INDEX IF NOT EXISTS sketch_values_edition ON sketch_values(edition_id);
+"""
+
+def open_index(index_path):
+    directory = os.path.dirname(index_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(index_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def markup_to_words(markup):
+    text = html.unescape(TAG_PATTERN.sub(' ', markup))
+    return WORD_PATTERN.findall(text.lower())
+
+def shingle_hash(words):
+    digest = hashlib.blake2b(' '.join(words).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+def compute_sketch(zip_ref, member_names):
+    hashes = set()
+    for name in member_names:
+        try:
+            markup = zip_ref.read(name).decode('utf-8', errors='replace')
+        except KeyError:
+            continue
+        words = markup_to_words(markup)
+        for i in range(len(words) - SHINGLE_WORDS + 1):
+            hashes.add(shingle_hash(words[i:i + SHINGLE_WORDS]))
+    return heapq.nsmallest(SKETCH_SIZE, hashes)
+
+def estimate_similarity(sketch_a, sketch_b):
+    set_a = set(sketch_a)
+    set_b = set(sketch_b)
+    union_sketch = heapq.nsmallest(SKETCH_SIZE, set_a | set_b)
+    if not union_sketch:
+        return 0.0
+    shared = sum(1 for value in union_sketch if value in set_a and value in set_b)
+    return shared / len(union_sketch)
+
+def load_sketch(conn, edition_id):
+    return [row[0] for row in conn.execute("SELECT value FROM sketch_values WHERE edition_id = ?", (edition_id,))]
+
+def find_duplicate(conn, name, sketch, min_similarity=DUPLICATE_SIMILARITY, preferred_suffix=None):
+    if not sketch:
+        return None
+    placeholders = ', '.join('?' for _ in sketch)
+    candidates = conn.execute(
+        f"""
+        SELECT editions.id, editions.name, editions.output_path, COUNT(*) AS shared
+        FROM sketch_values
+        JOIN editions ON editions.id = sketch_values.edition_id
+        WHERE sketch_values.value IN ({placeholders}) AND editions.name != ?
+        GROUP BY editions.id
+        ORDER BY shared DESC
+        LIMIT 5
+        """,
+        (*sketch, name),
+    ).fetchall()
+    best = None
+    best_key = None
+    for edition_id, edition_name, output_path, _ in candidates:
+        similarity = estimate_similarity(sketch, load_sketch(conn, edition_id))
+        if similarity < min_similarity:
+            continue
+        key = (bool(preferred_suffix) and output_path.endswith(preferred_suffix), similarity)
+        if best_key is None or key > best_key:
+            best = (edition_name, output_path, similarity)
+            best_key = key
+    return best
+
+def record_edition(conn, name, output_path, sketch):
+    row = conn.execute("SELECT id FROM editions WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        edition_id = conn.execute("INSERT INTO editions (name, output_path) VALUES (?, ?)", (name, output_path)).lastrowid
+    else:
+        edition_id = row[0]
+        conn.execute("UPDATE editions SET output_path = ? WHERE id = ?", (output_path, edition_id))
+        conn.execute("DELETE FROM sketch_values WHERE edition_id = ?", (edition_id,))
+    conn.executemany("INSERT INTO sketch_values (edition_id, value) VALUES (?, ?)", [(edition_id, value) for value in sketch])
+    conn.commit()
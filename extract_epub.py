@@ -1,40 +1,37 @@
 import os
+import posixpath
 import shutil
 import zipfile
 from bs4 import BeautifulSoup
 import tempfile
 import re
+from urllib.parse import unquote
+import edition_index
+import output_writers
+import search_index
+import supervisor
 
 output_folder = "./output"
 input_folder = "./input"
+max_uncompressed_bytes = 1024 ** 3
 
-def get_opf_path(temp_dir):
-    container_path = os.path.join(temp_dir, 'META-INF', 'container.xml')
-    if not os.path.exists(container_path):
-        return None
-    with open(container_path, 'r', encoding='utf-8') as f:
-        soup = BeautifulSoup(f, 'html.parser')
-        rootfiles = soup.find_all('rootfile')
-        for rootfile in rootfiles:
-            if rootfile.get('media-type') == 'application/oebps-package+xml':
-                full_path = rootfile.get('full-path')
-                if full_path:
-                    return os.path.join(temp_dir, full_path)
+def find_opf_full_path(container_soup):
+    for rootfile in container_soup.find_all('rootfile'):
+        if rootfile.get('media-type') == 'application/oebps-package+xml':
+            full_path = rootfile.get('full-path')
+            if full_path:
+                return full_path
     return None
 
-def get_content_paths(opf_path, temp_dir):
-    if opf_path is None or not os.path.exists(opf_path):
-        return []
-    with open(opf_path, 'r', encoding='utf-8') as f:
-        soup = BeautifulSoup(f, 'html.parser')
+def find_spine_hrefs(opf_soup):
     manifest = {}
-    for item in soup.find_all('item'):
+    for item in opf_soup.find_all('item'):
         item_id = item.get('id')
         href = item.get('href')
         properties = item.get('properties')
         if item_id and href and properties != 'nav':
             manifest[item_id] = href
-    spine = soup.find('spine')
+    spine = opf_soup.find('spine')
     if spine is None:
         return []
     ordered_hrefs = []
@@ -45,6 +42,25 @@ def get_content_paths(opf_path, temp_dir):
         idref = itemref.get('idref')
         if idref and idref in manifest:
             ordered_hrefs.append(manifest[idref])
+    return ordered_hrefs
+
+def get_opf_path(temp_dir):
+    container_path = os.path.join(temp_dir, 'META-INF', 'container.xml')
+    if not os.path.exists(container_path):
+        return None
+    with open(container_path, 'r', encoding='utf-8') as f:
+        soup = BeautifulSoup(f, 'html.parser')
+    full_path = find_opf_full_path(soup)
+    if full_path:
+        return os.path.join(temp_dir, full_path)
+    return None
+
+def get_content_paths(opf_path, temp_dir):
+    if opf_path is None or not os.path.exists(opf_path):
+        return []
+    with open(opf_path, 'r', encoding='utf-8') as f:
+        soup = BeautifulSoup(f, 'html.parser')
+    ordered_hrefs = find_spine_hrefs(soup)
     opf_dir = os.path.dirname(opf_path)
     content_paths = []
     for href in ordered_hrefs:
@@ -53,17 +69,98 @@ def get_content_paths(opf_path, temp_dir):
             content_paths.append(full_path)
     return content_paths
 
+def get_zip_content_names(zip_ref):
+    names = zip_ref.namelist()
+    if 'META-INF/container.xml' in names:
+        container_soup = BeautifulSoup(zip_ref.read('META-INF/container.xml'), 'html.parser')
+        opf_name = find_opf_full_path(container_soup)
+        if opf_name in names:
+            opf_soup = BeautifulSoup(zip_ref.read(opf_name), 'html.parser')
+            opf_dir = posixpath.dirname(opf_name)
+            content_names = [posixpath.normpath(posixpath.join(opf_dir, unquote(href))) for href in find_spine_hrefs(opf_soup)]
+            if content_names:
+                return content_names
+    content_names = [n for n in names if n.lower().endswith(('.xhtml', '.html', '.htm'))]
+    content_names.sort(key=lambda n: [int(s) if s.isdigit() else s for s in re.split(r'([0-9]+)', n.lower())])
+    return content_names
+
 def natural_sort_key(path, temp_dir):
     rel = os.path.relpath(path, temp_dir).lower()
     return [int(s) if s.isdigit() else s for s in re.split(r'([0-9]+)', rel)]
 
-def extract_text_from_epub(epub_path, output_folder):
-    epub_filename = os.path.basename(epub_path).replace('.epub', '.txt')
-    output_path = os.path.join(output_folder, epub_filename)
+def check_zip_size(epub_path):
+    try:
+        with zipfile.ZipFile(epub_path, 'r') as zip_ref:
+            total = sum(info.file_size for info in zip_ref.infolist())
+    except zipfile.BadZipFile:
+        return None
+    if total > max_uncompressed_bytes:
+        return f"uncompressed size {total} bytes exceeds limit of {max_uncompressed_bytes} bytes"
+    return None
+
+def link_existing_output(existing_output, output_path):
+    if os.path.exists(output_path):
+        if os.path.samefile(existing_output, output_path):
+            return
+        os.remove(output_path)
+    try:
+        os.link(existing_output, output_path)
+    except OSError:
+        shutil.copyfile(existing_output, output_path)
+    print(f"Linked {output_path} to existing output {existing_output}")
+
+def get_output_path(epub_path, output_folder, output_format='txt', compression=None):
+    epub_filename = os.path.basename(epub_path).replace('.epub', output_writers.output_extension(output_format, compression))
+    return os.path.join(output_folder, epub_filename)
+
+def remove_partial_output(epub_path, output_folder, index_path=None, edition_index_path=None, duplicate_action='report', output_format='txt', compression=None):
+    partial_path = get_output_path(epub_path, output_folder, output_format, compression) + '.part'
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
+def extract_text_from_epub(epub_path, output_folder, index_path=None, edition_index_path=None, duplicate_action='report', output_format='txt', compression=None):
+    output_path = get_output_path(epub_path, output_folder, output_format, compression)
+    epub_filename = os.path.basename(output_path)
+    partial_path = output_path + '.part'
     temp_dir = tempfile.mkdtemp()
+    index_conn = None
+    edition_conn = None
+    writer = None
     try:
+        size_problem = check_zip_size(epub_path)
+        if size_problem:
+            print(f"Error: {os.path.basename(epub_path)} {size_problem}")
+            return
         with zipfile.ZipFile(epub_path, 'r') as zip_ref:
+            if edition_index_path:
+                edition_conn = edition_index.open_index(edition_index_path)
+                sketch = edition_index.compute_sketch(zip_ref, get_zip_content_names(zip_ref))
+                output_suffix = output_writers.output_extension(output_format, compression)
+                duplicate = edition_index.find_duplicate(edition_conn, os.path.basename(epub_path), sketch, preferred_suffix=output_suffix)
+                if duplicate:
+                    duplicate_name, existing_output, similarity = duplicate
+                    print(f"Near-duplicate of {duplicate_name} (similarity {similarity:.2f}), existing output: {existing_output}")
+                    same_format = existing_output.endswith(output_suffix)
+                    if duplicate_action == 'link' and not same_format:
+                        print("Existing output has a different format, extracting instead of linking")
+                    if duplicate_action == 'link' and same_format and os.path.isfile(existing_output):
+                        link_existing_output(existing_output, output_path)
+                        if index_path:
+                            index_conn = search_index.open_index(index_path)
+                            copied = search_index.copy_book(index_conn, duplicate_name, os.path.basename(epub_path), output_path)
+                            if copied:
+                                index_conn.commit()
+                                print(f"Indexed {copied} chapter(s) in {index_path} (copied from {duplicate_name})")
+                            else:
+                                print(f"Not indexed: {duplicate_name} has no entries in {index_path}")
+                        return
+                    if duplicate_action == 'skip':
+                        print(f"Skipped: {epub_filename}")
+                        return
             zip_ref.extractall(temp_dir)
+        if index_path:
+            index_conn = search_index.open_index(index_path)
+            book_id = search_index.begin_book(index_conn, os.path.basename(epub_path), output_path)
         opf_path = get_opf_path(temp_dir)
         content_paths = get_content_paths(opf_path, temp_dir)
         fallback_used = False
@@ -80,10 +177,11 @@ def extract_text_from_epub(epub_path, output_folder):
                             content_paths.append(full_path)
             if content_paths:
                 content_paths.sort(key=lambda p: natural_sort_key(p, temp_dir))
-        core_parts = []
+        chapter_count = 0
         bad_classes = ['note', 'footnote', 'sidenote', 'marginnote', 'endnote', 'reference']
         bad_tags = ['script', 'style', 'aside', 'footer', 'nav', 'sup', 'header']
-        for file_path in content_paths:
+        offset = 0
+        for spine_index, file_path in enumerate(content_paths):
             if not os.path.isfile(file_path):
                 continue
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -117,20 +215,45 @@ def extract_text_from_epub(epub_path, output_folder):
             if cleaned_text:
                 part.append(cleaned_text)
             if part:
-                core_parts.append('\n\n'.join(part))
-        if not core_parts:
+                chapter_text = '\n\n'.join(part)
+                if chapter_count:
+                    offset += len(output_writers.CHAPTER_SEPARATOR)
+                if writer is None:
+                    writer = output_writers.open_chapter_writer(partial_path, output_format, compression)
+                writer.write_chapter(spine_index, title_text, chapter_text, offset, offset + len(chapter_text))
+                chapter_count += 1
+                if index_conn is not None:
+                    search_index.add_chapter(index_conn, book_id, spine_index, title_text, offset, offset + len(chapter_text), cleaned_text)
+                offset += len(chapter_text)
+        if not chapter_count:
             print("Warning: No text content found in the EPUB")
             return
-        full_text = '\n\n\n\n'.join(core_parts)
-        with open(output_path, 'w', encoding='utf-8') as output_file:
-            output_file.write(full_text)
+        writer.close()
+        writer = None
+        os.replace(partial_path, output_path)
         method = "fallback method" if fallback_used else "OPF spine order"
         print(f"Extracted text from: {epub_filename} (using {method})")
+        if index_conn is not None:
+            index_conn.commit()
+            print(f"Indexed {chapter_count} chapter(s) in {index_path}")
+        if edition_conn is not None:
+            edition_index.record_edition(edition_conn, os.path.basename(epub_path), output_path, sketch)
     except zipfile.BadZipFile:
         print("Error: The file is not a valid EPUB")
+    except MemoryError:
+        raise
     except Exception as e:
         print(f"Error processing {epub_filename}: {str(e)}")
     finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        if index_conn is not None:
+            index_conn.rollback()
+            index_conn.close()
+        if edition_conn is not None:
+            edition_conn.close()
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 def main():
@@ -149,20 +272,43 @@ def main():
     print("\nFound EPUB files:")
     for index, filename in enumerate(epub_files, start=1):
         print(f"{index}. {filename}")
+    index_input = input("\nAdd extracted chapters to the search index? (y/N): ").strip().lower()
+    index_path = search_index.default_index_path if index_input == 'y' else None
+    duplicate_input = input("Near-duplicate editions: (r)eport, (s)kip or (l)ink to existing output? (Enter to disable): ").strip().lower()
+    duplicate_actions = {'r': 'report', 's': 'skip', 'l': 'link'}
+    duplicate_action = duplicate_actions.get(duplicate_input[:1])
+    edition_index_path = edition_index.default_index_path if duplicate_action else None
+    format_input = input("Output format: (t)xt or (j)son lines? (default txt): ").strip().lower()
+    output_format = 'jsonl' if format_input[:1] == 'j' else 'txt'
+    compression_input = input("Compression: (g)zip, (z)std or none? (default none): ").strip().lower()
+    compression = {'g': 'gzip', 'z': 'zstd'}.get(compression_input[:1])
+    if not output_writers.compression_available(compression):
+        print("zstd output requires the 'zstandard' package (pip install zstandard)")
+        return
     while True:
         choice = input(
-            "\nEnter the number of the file to convert (or press Enter to quit): "
+            "\nEnter the number of the file to convert, 'a' for all (or press Enter to quit): "
         ).strip()
         if choice == "":
             print("No file selected, exiting")
             return
+        if choice.lower() == 'a':
+            options = (output_folder, index_path, edition_index_path, duplicate_action, output_format, compression)
+            supervisor.run_batch(
+                extract_text_from_epub,
+                [(path, *options) for path in full_paths],
+                epub_files,
+                precheck=check_zip_size,
+                cleanup=remove_partial_output,
+            )
+            return
         if choice.isdigit():
             num = int(choice)
             if 1 <= num <= len(epub_files):
                 selected_path = full_paths[num - 1]
                 selected_name = epub_files[num - 1]
                 print(f"Converting: {selected_name}")
-                extract_text_from_epub(selected_path, output_folder)
+                extract_text_from_epub(selected_path, output_folder, index_path, edition_index_path, duplicate_action, output_format, compression)
                 return
             else:
                 print("Number out of range, please try again")
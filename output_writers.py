@@ -0,0 +1,81 @@
+import gzip
+import io
+import json
+
+CHAPTER_SEPARATOR = '\n\n\n\n'
+FORMAT_EXTENSIONS = {'txt': '.txt', 'jsonl': '.jsonl'}
+COMPRESSION_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+def output_extension(output_format='txt', compression=None):
+    if output_format not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    return FORMAT_EXTENSIONS[output_format] + COMPRESSION_EXTENSIONS[compression]
+
+def compression_available(compression):
+    if compression != 'zstd':
+        return True
+    try:
+        import zstandard
+    except ImportError:
+        return False
+    return True
+
+def open_text_stream(path, compression=None):
+    if compression is None:
+        return open(path, 'w', encoding='utf-8')
+    if compression == 'gzip':
+        return gzip.open(path, 'wt', encoding='utf-8')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd output requires the 'zstandard' package")
+        raw = open(path, 'wb')
+        try:
+            compressed = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        except BaseException:
+            raw.close()
+            raise
+        return io.TextIOWrapper(compressed, encoding='utf-8')
+    raise ValueError(f"Unknown compression: {compression}")
+
+class TextChapterWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.chapter_count = 0
+
+    def write_chapter(self, spine_index, title, text, start_offset, end_offset):
+        if self.chapter_count:
+            self.stream.write(CHAPTER_SEPARATOR)
+        self.stream.write(text)
+        self.chapter_count += 1
+
+    def close(self):
+        self.stream.close()
+
+class JsonLinesChapterWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.chapter_count = 0
+
+    def write_chapter(self, spine_index, title, text, start_offset, end_offset):
+        record = {
+            'spine_index': spine_index,
+            'title': title,
+            'start': start_offset,
+            'end': end_offset,
+            'text': text,
+        }
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.chapter_count += 1
+
+    def close(self):
+        self.stream.close()
+
+WRITERS = {'txt': TextChapterWriter, 'jsonl': JsonLinesChapterWriter}
+
+def open_chapter_writer(path, output_format='txt', compression=None):
+    writer_class = WRITERS[output_format]
+    return writer_class(open_text_stream(path, compression))
@@ -1,42 +1,72 @@
+import io
+import json
+import mmap
+import os
+import re
+import shutil
 import sys
+import tempfile
+from bisect import bisect_left
 from dataclasses import dataclass, field
 from enum import Enum, auto
 from typing import Optional
 
+MAX_MAPPED_SPAN_BYTES = 64 * 1024
+COPY_CHUNK_BYTES = 1024 * 1024
+PAREN_BYTES = re.compile(rb'[()]')
+PAREN_CHARS = re.compile(r'[()]')
+SIDECAR_VERSION = 2
+LINE_BREAKS = '\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029'
+
 class TokenKind(Enum):
-    TEXT = auto()
     OPEN = auto()
     CLOSE = auto()
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     kind: TokenKind
     char: str
     position: int
 
-@dataclass
+@dataclass(slots=True)
 class ParenSpan:
     start: int
     end: int
-    inner: str
-    outer: str
+    source: str = field(repr=False, compare=False)
+
+    @property
+    def inner(self):
+        return self.source[self.start + 1:self.end - 1]
+
+    @property
+    def outer(self):
+        return self.source[self.start:self.end]
+
+@dataclass(slots=True)
+class MappedParenSpan:
+    start: int
+    end: int
+    source: mmap.mmap = field(repr=False, compare=False)
 
-@dataclass
+    @property
+    def inner(self):
+        return self.source[self.start + 1:self.end - 1].decode('utf-8', errors='replace')
+
+    @property
+    def outer(self):
+        return self.source[self.start:self.end].decode('utf-8', errors='replace')
+
+@dataclass(slots=True)
 class ScoredSpan:
     span: ParenSpan
     score: float
-    evidence: list[str] = field(default_factory=list)
-
-def tokenize(text):
-    tokens = []
-    for i, ch in enumerate(text):
-        if ch == '(':
-            tokens.append(Token(TokenKind.OPEN, ch, i))
-        elif ch == ')':
-            tokens.append(Token(TokenKind.CLOSE, ch, i))
-        else:
-            tokens.append(Token(TokenKind.TEXT, ch, i))
-    return tokens
+    evidence: Optional[list[str]] = None
+
+def iter_paren_tokens(text):
+    for match in PAREN_CHARS.finditer(text):
+        ch = match.group()
+        kind = TokenKind.OPEN if ch == '(' else TokenKind.CLOSE
+        yield Token(kind, ch, match.start())
 
 def extract_balanced_spans(tokens, text):
     spans = []
@@ -48,14 +78,10 @@ def extract_balanced_spans(tokens, text):
             if not stack:
                 continue
             open_pos = stack.pop()
-            close_pos = token.position
-            inner = text[open_pos + 1:close_pos]
-            outer = text[open_pos:close_pos + 1]
             spans.append(ParenSpan(
                 start=open_pos,
-                end=close_pos + 1,
-                inner=inner,
-                outer=outer,
+                end=token.position + 1,
+                source=text,
             ))
     return spans
 
@@ -176,23 +202,44 @@ def looks_like_latin_abbreviation(word):
 
 CITATION_CONNECTIVES = {'and', 'see', 'also', 'in', 'cf', 'e', 'g', 'i', 'b', 'a'}
 
-def score_span(span):
+SCORE_WEIGHTS = {
+    'max_length': 200,
+    'latin': 1000.0,
+    'max_lowercase_ratio': 0.35,
+    'max_lowercase_count': 3,
+    'year': 40.0,
+    'author': 25.0,
+    'pages': 15.0,
+    'colon': 10.0,
+    'semicolon': 8.0,
+    'free_words': 12,
+    'word_penalty': 4.0,
+}
+
+def rejected(span, explain, reason):
+    if not explain:
+        return ScoredSpan(span=span, score=0.0, evidence=None)
+    return ScoredSpan(span=span, score=0.0, evidence=[reason() if callable(reason) else reason])
+
+def score_span(span, explain=False, weights=SCORE_WEIGHTS):
     text = normalize(span.inner)
     score = 0.0
-    evidence = []
+    evidence = [] if explain else None
     if not text:
-        return ScoredSpan(span=span, score=0.0, evidence=['empty content'])
-    if len(text) > 200:
-        return ScoredSpan(span=span, score=0.0, evidence=['too long to be a citation'])
+        return rejected(span, explain, 'empty content')
+    if len(text) > weights['max_length']:
+        return rejected(span, explain, 'too long to be a citation')
     numeric_tokens = extract_numeric_tokens(text)
     years, pages = classify_numeric_tokens_from_text(text, numeric_tokens)
     word_tokens = extract_word_tokens(text)
     punct_classes = count_punctuation_classes(text)
     latin_words = [w for w in word_tokens if looks_like_latin_abbreviation(w)]
     if latin_words:
-        return ScoredSpan(span=span, score=1000.0, evidence=[f'latin citation abbreviation forces acceptance: {latin_words}'])
+        return ScoredSpan(span=span, score=weights['latin'], evidence=[
+            f'latin citation abbreviation forces acceptance: {latin_words}'
+        ] if explain else None)
     if not years:
-        return ScoredSpan(span=span, score=0.0, evidence=['no year present — required for citation'])
+        return rejected(span, explain, 'no year present — required for citation')
     lowercase_words = [w for w in word_tokens if w[0].islower() and w.lower() not in CITATION_CONNECTIVES]
     author_words = [w for w in word_tokens if looks_like_author_name(w)]
     total_words = len(word_tokens)
@@ -201,58 +248,73 @@ def score_span(span):
         lowercase_ratio = lowercase_count / total_words
     else:
         lowercase_ratio = 0.0
-    if lowercase_ratio > 0.35:
-        return ScoredSpan(span=span, score=0.0, evidence=[
+    if lowercase_ratio > weights['max_lowercase_ratio']:
+        return rejected(span, explain, lambda: (
             f'too many lowercase words ({lowercase_count}/{total_words} = {lowercase_ratio:.0%}), looks like prose'
-        ])
-    if lowercase_count > 3:
-        return ScoredSpan(span=span, score=0.0, evidence=[
+        ))
+    if lowercase_count > weights['max_lowercase_count']:
+        return rejected(span, explain, lambda: (
             f'too many lowercase words in absolute terms ({lowercase_count}): {lowercase_words}'
-        ])
-    score += 40.0
-    evidence.append(f'contains year(s): {years}')
+        ))
+    score += weights['year']
+    if explain:
+        evidence.append(f'contains year(s): {years}')
     if not author_words and not pages:
-        return ScoredSpan(span=span, score=0.0, evidence=['year only, no author or page number — too ambiguous'])
+        return rejected(span, explain, 'year only, no author or page number — too ambiguous')
     if author_words:
-        score += 25.0
-        evidence.append(f'author-like capitalized words: {author_words}')
+        score += weights['author']
+        if explain:
+            evidence.append(f'author-like capitalized words: {author_words}')
     if pages:
-        score += 15.0
-        evidence.append(f'contains page number(s): {pages}')
+        score += weights['pages']
+        if explain:
+            evidence.append(f'contains page number(s): {pages}')
     if 'colon' in punct_classes:
-        score += 10.0
-        evidence.append('colon present (page separator)')
+        score += weights['colon']
+        if explain:
+            evidence.append('colon present (page separator)')
     if 'semicolon' in punct_classes:
-        score += 8.0
-        evidence.append('semicolon present (citation list separator)')
-    if total_words > 12:
-        penalty = (total_words - 12) * 4.0
+        score += weights['semicolon']
+        if explain:
+            evidence.append('semicolon present (citation list separator)')
+    if total_words > weights['free_words']:
+        penalty = (total_words - weights['free_words']) * weights['word_penalty']
         score -= penalty
-        evidence.append(f'penalized for high word count ({total_words} words, -{penalty:.1f})')
+        if explain:
+            evidence.append(f'penalized for high word count ({total_words} words, -{penalty:.1f})')
     return ScoredSpan(span=span, score=score, evidence=evidence)
 
+def explain_span(scored_span, weights=SCORE_WEIGHTS):
+    if scored_span.evidence is None:
+        scored_span.evidence = score_span(scored_span.span, explain=True, weights=weights).evidence
+    return scored_span.evidence
+
 def resolve_overlapping_spans(scored_spans):
-    sorted_spans = sorted(scored_spans, key=lambda s: s.score, reverse=True)
+    by_start = sorted(scored_spans, key=lambda s: s.span.start)
+    starts = [ss.span.start for ss in by_start]
+    rank = {id(ss): i for i, ss in enumerate(by_start)}
+    covered = bytearray(len(by_start))
     accepted = []
-    covered = set()
-    for ss in sorted_spans:
-        positions = set(range(ss.span.start, ss.span.end))
-        if positions & covered:
+    for ss in sorted(scored_spans, key=lambda s: s.score, reverse=True):
+        first = rank[id(ss)]
+        last = bisect_left(starts, ss.span.end)
+        if covered.find(1, first, last) != -1:
             continue
         accepted.append(ss)
-        covered |= positions
+        covered[first:last] = b'\x01' * (last - first)
     return accepted
 
+def kept_ranges(length, accepted_spans):
+    position = 0
+    for start, end in sorted((ss.span.start, ss.span.end) for ss in accepted_spans):
+        if start > position:
+            yield position, start
+        position = max(position, end)
+    if position < length:
+        yield position, length
+
 def remove_accepted_spans(text, accepted_spans):
-    removal_ranges = sorted(
-        [(ss.span.start, ss.span.end) for ss in accepted_spans],
-        key=lambda r: r[0],
-        reverse=True
-    )
-    chars = list(text)
-    for start, end in removal_ranges:
-        chars[start:end] = []
-    return ''.join(chars)
+    return ''.join(text[start:end] for start, end in kept_ranges(len(text), accepted_spans))
 
 def collapse_leftover_whitespace(text):
     lines = text.splitlines(keepends=True)
@@ -272,21 +334,83 @@ def collapse_leftover_whitespace(text):
         result.append(' '.join(words) + ending)
     return ''.join(result)
 
-def process_file(path, threshold=40.0, dry_run=False):
+def print_span(ss, label='', weights=SCORE_WEIGHTS):
+    print(f"  {label}[{ss.span.start}:{ss.span.end}] score={ss.score:.1f} | {ss.span.outer!r}")
+    for e in explain_span(ss, weights):
+        print(f"    · {e}")
+
+def print_summary(span_count, candidates, accepted, weights=SCORE_WEIGHTS):
+    print(f"Scanned {span_count} parenthesized span(s), "
+          f"{len(candidates)} passed threshold, "
+          f"{len(accepted)} accepted after overlap resolution.")
+    for ss in sorted(accepted, key=lambda s: s.span.start):
+        print_span(ss, weights=weights)
+
+def sidecar_path(path):
+    return path + '.citations.json'
+
+def load_sidecar(path, weights=SCORE_WEIGHTS):
+    try:
+        with open(sidecar_path(path), 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(record, dict):
+        return None
+    if record.get('version') != SIDECAR_VERSION or record.get('weights') != weights:
+        return None
+    scores = record.get('scores')
+    if not isinstance(scores, dict):
+        return None
+    try:
+        return {str(key): float(score) for key, score in scores.items()}
+    except (TypeError, ValueError):
+        return None
+
+def save_sidecar(path, scored, weights=SCORE_WEIGHTS):
+    record = {
+        'version': SIDECAR_VERSION,
+        'weights': weights,
+        'scores': {normalize(ss.span.inner): ss.score for ss in scored},
+    }
+    with open(sidecar_path(path), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+
+def score_spans_incrementally(spans, previous, explain=False, weights=SCORE_WEIGHTS):
+    if previous is None:
+        return [score_span(span, explain, weights) for span in spans], len(spans)
+    scored = []
+    rescored = 0
+    for span in spans:
+        score = previous.get(normalize(span.inner))
+        if score is None:
+            scored.append(score_span(span, explain, weights))
+            rescored += 1
+        else:
+            scored.append(ScoredSpan(span=span, score=score, evidence=None))
+    return scored, rescored
+
+def process_file(path, threshold=40.0, dry_run=False, verbose=False, incremental=False, weights=SCORE_WEIGHTS):
     with open(path, 'r', encoding='utf-8') as f:
         text = f.read()
-    tokens = tokenize(text)
-    spans = extract_balanced_spans(tokens, text)
-    scored = [score_span(span) for span in spans]
+    spans = extract_balanced_spans(iter_paren_tokens(text), text)
+    if incremental:
+        previous = load_sidecar(path, weights)
+        scored, rescored = score_spans_incrementally(spans, previous, verbose, weights)
+        if previous is not None:
+            print(f"Re-scored {rescored} of {len(spans)} span(s), reused the rest from {sidecar_path(path)}.")
+    else:
+        scored = [score_span(span, verbose, weights) for span in spans]
     candidates = [ss for ss in scored if ss.score >= threshold]
     accepted = resolve_overlapping_spans(candidates)
-    print(f"Scanned {len(spans)} parenthesized span(s), "
-          f"{len(candidates)} passed threshold, "
-          f"{len(accepted)} accepted after overlap resolution.")
-    for ss in sorted(accepted, key=lambda s: s.span.start):
-        print(f"  [{ss.span.start}:{ss.span.end}] score={ss.score:.1f} | {ss.span.outer!r}")
-        for e in ss.evidence:
-            print(f"    · {e}")
+    print_summary(len(spans), candidates, accepted, weights)
+    if verbose:
+        accepted_ids = {id(ss) for ss in accepted}
+        for ss in scored:
+            if id(ss) not in accepted_ids:
+                print_span(ss, 'rejected ', weights)
+    if incremental:
+        save_sidecar(path, scored, weights)
     if dry_run:
         print("Dry run — no file written.")
         return
@@ -296,7 +420,138 @@ def process_file(path, threshold=40.0, dry_run=False):
         f.write(cleaned)
     print(f"Written: {path}")
 
+def iter_mapped_spans(mm):
+    stack = []
+    for match in PAREN_BYTES.finditer(mm):
+        position = match.start()
+        if mm[position] == 0x28:
+            stack.append(position)
+        elif stack:
+            yield MappedParenSpan(start=stack.pop(), end=position + 1, source=mm)
+
+def score_mapped_span(span, explain=False, weights=SCORE_WEIGHTS):
+    if span.end - span.start > MAX_MAPPED_SPAN_BYTES:
+        return rejected(span, explain, 'too long to be a citation')
+    return score_span(span, explain, weights)
+
+class KeptRangesReader(io.RawIOBase):
+    def __init__(self, mm, ranges):
+        self.mm = mm
+        self.ranges = iter(ranges)
+        self.position = 0
+        self.end = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.position >= self.end:
+            try:
+                self.position, self.end = next(self.ranges)
+            except StopIteration:
+                return 0
+        n = min(len(buffer), self.end - self.position, COPY_CHUNK_BYTES)
+        if self.mm[self.position + n - 1] == 0x0D and self.position + n < self.end:
+            n = n - 1 if n > 1 else 2
+        data = self.mm[self.position:self.position + n].replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        self.position += n
+        buffer[:len(data)] = data
+        return len(data)
+
+def collapse_whitespace_stream(chunks, out):
+    has_word = False
+    pending_space = False
+    for chunk in chunks:
+        for piece in chunk.splitlines(keepends=True):
+            complete = piece[-1] in LINE_BREAKS
+            if piece.endswith('\r\n'):
+                body, ending = piece[:-2], '\r\n'
+            elif complete:
+                body, ending = piece[:-1], piece[-1] if piece[-1] in '\r\n' else ''
+            else:
+                body = piece
+            words = body.split()
+            if words:
+                if has_word and (pending_space or body[0].isspace()):
+                    out.write(' ')
+                out.write(' '.join(words))
+                has_word = True
+                pending_space = body[-1].isspace()
+            elif body:
+                pending_space = True
+            if complete:
+                out.write(ending)
+                has_word = False
+                pending_space = False
+
+def write_kept_ranges(mm, accepted, out):
+    reader = io.TextIOWrapper(
+        io.BufferedReader(KeptRangesReader(mm, kept_ranges(len(mm), accepted)), COPY_CHUNK_BYTES),
+        encoding='utf-8',
+        errors='surrogateescape',
+    )
+    collapse_whitespace_stream(iter(lambda: reader.read(COPY_CHUNK_BYTES), ''), out)
+
+def process_file_mmap(path, threshold=40.0, dry_run=False, verbose=False, weights=SCORE_WEIGHTS):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            print("Input file is empty.")
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    temp_path = None
+    try:
+        span_count = 0
+        candidates = []
+        for span in iter_mapped_spans(mm):
+            span_count += 1
+            ss = score_mapped_span(span, verbose, weights)
+            if ss.score >= threshold:
+                candidates.append(ss)
+            elif verbose:
+                print_span(ss, 'rejected ', weights)
+        accepted = resolve_overlapping_spans(candidates)
+        print_summary(span_count, candidates, accepted, weights)
+        if verbose:
+            accepted_ids = {id(ss) for ss in accepted}
+            for ss in candidates:
+                if id(ss) not in accepted_ids:
+                    print_span(ss, 'rejected ', weights)
+        if dry_run:
+            print("Dry run — no file written.")
+            return
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with open(fd, 'w', encoding='utf-8', errors='surrogateescape') as out:
+            write_kept_ranges(mm, accepted, out)
+        mm.close()
+        with open(temp_path, 'rb') as src, open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_BYTES)
+    finally:
+        mm.close()
+        if temp_path is not None:
+            os.remove(temp_path)
+    print(f"Written: {path}")
+
+def load_weights(weights_path):
+    with open(weights_path, 'r', encoding='utf-8') as f:
+        overrides = json.load(f)
+    unknown = set(overrides) - set(SCORE_WEIGHTS)
+    if unknown:
+        raise ValueError(f"Unknown score weight(s) in {weights_path}: {sorted(unknown)}")
+    return {**SCORE_WEIGHTS, **overrides}
+
 if __name__ == '__main__':
     path = input('Input file (input.txt): ') or 'input.txt'
     dry_run = '--dry-run' in sys.argv
-    process_file(path, dry_run=dry_run)
+    verbose = '--verbose' in sys.argv
+    threshold = 40.0
+    weights = SCORE_WEIGHTS
+    for arg in sys.argv[1:]:
+        if arg.startswith('--threshold='):
+            threshold = float(arg.partition('=')[2])
+        elif arg.startswith('--weights='):
+            weights = load_weights(arg.partition('=')[2])
+    if '--mmap' in sys.argv:
+        process_file_mmap(path, threshold, dry_run=dry_run, verbose=verbose, weights=weights)
+    else:
+        incremental = '--incremental' in sys.argv
+        process_file(path, threshold, dry_run=dry_run, verbose=verbose, incremental=incremental, weights=weights)
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+
+default_index_path = "./output/search.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    output_path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    id INTEGER PRIMARY KEY,
+    book_id INTEGER NOT NULL REFERENCES books(id),
+    spine_index INTEGER NOT NULL,
+    title TEXT,
+    start_offset INTEGER NOT NULL,
+    end_offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chapters_book ON chapters(book_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS chapter_text USING fts5(title, body);
+"""
+
+def open_index(index_path):
+    directory = os.path.dirname(index_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(index_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def begin_book(conn, book_name, output_path):
+    row = conn.execute("SELECT id FROM books WHERE name = ?", (book_name,)).fetchone()
+    if row is None:
+        cursor = conn.execute("INSERT INTO books (name, output_path) VALUES (?, ?)", (book_name, output_path))
+        return cursor.lastrowid
+    book_id = row[0]
+    conn.execute("UPDATE books SET output_path = ? WHERE id = ?", (output_path, book_id))
+    conn.execute("DELETE FROM chapter_text WHERE rowid IN (SELECT id FROM chapters WHERE book_id = ?)", (book_id,))
+    conn.execute("DELETE FROM chapters WHERE book_id = ?", (book_id,))
+    return book_id
+
+def add_chapter(conn, book_id, spine_index, title, start_offset, end_offset, text):
+    cursor = conn.execute(
+        "INSERT INTO chapters (book_id, spine_index, title, start_offset, end_offset) VALUES (?, ?, ?, ?, ?)",
+        (book_id, spine_index, title, start_offset, end_offset),
+    )
+    conn.execute("INSERT INTO chapter_text (rowid, title, body) VALUES (?, ?, ?)", (cursor.lastrowid, title or '', text))
+
+def copy_book(conn, source_name, book_name, output_path):
+    row = conn.execute("SELECT id FROM books WHERE name = ?", (source_name,)).fetchone()
+    if row is None:
+        return 0
+    chapters = conn.execute(
+        """
+        SELECT chapters.spine_index, chapters.title, chapters.start_offset, chapters.end_offset, chapter_text.body
+        FROM chapters JOIN chapter_text ON chapter_text.rowid = chapters.id
+        WHERE chapters.book_id = ?
+        ORDER BY chapters.spine_index
+        """,
+        (row[0],),
+    ).fetchall()
+    book_id = begin_book(conn, book_name, output_path)
+    for spine_index, title, start_offset, end_offset, body in chapters:
+        add_chapter(conn, book_id, spine_index, title, start_offset, end_offset, body)
+    return len(chapters)
+
+def search(conn, query, limit=20):
+    return conn.execute(
+        """
+        SELECT books.name, books.output_path, chapters.spine_index, chapters.title,
+               chapters.start_offset, chapters.end_offset,
+               snippet(chapter_text, 1, '[', ']', '...', 12)
+        FROM chapter_text
+        JOIN chapters ON chapters.id = chapter_text.rowid
+        JOIN books ON books.id = chapters.book_id
+        WHERE chapter_text MATCH ?
+        ORDER BY rank
+        LIMIT ?
+        """,
+        (query, limit),
+    ).fetchall()
+
+def describe_location(output_path, spine_index, start, end):
+    name = output_path
+    for suffix in ('.gz', '.zst'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    if name.endswith('.jsonl'):
+        return f"record with spine_index {spine_index} in {output_path}"
+    if name != output_path:
+        return f"chars {start}-{end} of the decompressed text of {output_path}"
+    return f"chars {start}-{end} of {output_path}"
+
+def main():
+    index_path = input(f'Index file (default "{default_index_path}"): ').strip().strip('"\'') or default_index_path
+    if not os.path.isfile(index_path):
+        print("The index file does not exist.")
+        return
+    conn = open_index(index_path)
+    try:
+        while True:
+            query = input("\nSearch query (or press Enter to quit): ").strip()
+            if query == "":
+                return
+            try:
+                results = search(conn, query)
+            except sqlite3.OperationalError as e:
+                print(f"Invalid query: {e}")
+                continue
+            if not results:
+                print("No matches found")
+                continue
+            for name, output_path, spine_index, title, start, end, snippet in results:
+                print(f"{name} | #{spine_index} {title or '(untitled)'} | {describe_location(output_path, spine_index, start, end)}")
+                print(f"    {snippet}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
+
+default_quarantine_path = "./output/quarantine.jsonl"
+default_time_limit = 600
+default_memory_limit = 2 * 1024 ** 3
+default_grace_period = 5
+
+def usable_memory_limit(memory_limit):
+    if not memory_limit:
+        return None
+    if resource is None:
+        print("Warning: memory limits are not supported on this platform, running without a memory cap")
+        return None
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+    except (ValueError, OSError, AttributeError) as e:
+        print(f"Warning: cannot set a memory limit ({e}), running without a memory cap")
+        return None
+    if hard != resource.RLIM_INFINITY and memory_limit > hard:
+        return hard
+    return memory_limit
+
+def raise_system_exit(signum, frame):
+    raise SystemExit(f"terminated by signal {signum}")
+
+def limited_call(func, args, memory_limit, scratch_dir):
+    tempfile.tempdir = scratch_dir
+    signal.signal(signal.SIGTERM, raise_system_exit)
+    if memory_limit and resource is not None:
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ValueError, OSError):
+            pass
+    func(*args)
+
+def run_supervised(func, args, time_limit=default_time_limit, memory_limit=default_memory_limit, grace_period=default_grace_period):
+    scratch_dir = tempfile.mkdtemp(prefix='supervised-')
+    try:
+        process = multiprocessing.Process(target=limited_call, args=(func, args, memory_limit, scratch_dir))
+        process.start()
+        process.join(time_limit)
+        if process.is_alive():
+            process.terminate()
+            process.join(grace_period)
+            if process.is_alive():
+                process.kill()
+                process.join()
+            return f"exceeded time limit of {time_limit}s"
+        if process.exitcode != 0:
+            if memory_limit:
+                return f"worker exited with code {process.exitcode} (memory limit of {memory_limit} bytes or crash)"
+            return f"worker exited with code {process.exitcode}"
+        return None
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def load_quarantine(quarantine_path):
+    names = set()
+    if not os.path.isfile(quarantine_path):
+        return names
+    with open(quarantine_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                names.add(json.loads(line)['name'])
+    return names
+
+def add_to_quarantine(quarantine_path, name, reason):
+    directory = os.path.dirname(quarantine_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    record = {'name': name, 'reason': reason, 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+    with open(quarantine_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    print(f"Quarantined {name}: {reason}")
+
+def run_batch(func, items, names, time_limit=default_time_limit, memory_limit=default_memory_limit, quarantine_path=default_quarantine_path, precheck=None, cleanup=None):
+    quarantined = load_quarantine(quarantine_path)
+    memory_limit = usable_memory_limit(memory_limit)
+    for args, name in zip(items, names):
+        if name in quarantined:
+            print(f"Skipping quarantined item: {name}")
+            continue
+        reason = precheck(args[0]) if precheck else None
+        if reason is None:
+            reason = run_supervised(func, args, time_limit, memory_limit)
+        if reason is not None:
+            if cleanup:
+                cleanup(*args)
+            add_to_quarantine(quarantine_path, name, reason)
+            quarantined.add(name)
@@ -0,0 +1,191 @@
+import itertools
+import json
+import os
+import sys
+import numpy as np
+from remove_citations import (
+    CITATION_CONNECTIVES,
+    SCORE_WEIGHTS,
+    classify_numeric_tokens_from_text,
+    count_punctuation_classes,
+    extract_balanced_spans,
+    extract_numeric_tokens,
+    extract_word_tokens,
+    iter_paren_tokens,
+    looks_like_author_name,
+    looks_like_latin_abbreviation,
+    normalize,
+    score_span,
+)
+
+FEATURE_COLUMNS = ['start', 'end', 'valid', 'latin', 'years', 'pages', 'authors', 'lowercase', 'words', 'colon', 'semicolon']
+COLUMN = {name: i for i, name in enumerate(FEATURE_COLUMNS)}
+
+FEATURE_SCHEMA_VERSION = 1
+CONSISTENCY_SAMPLE = 2000
+
+WEIGHT_GRID = {
+    'author': [15.0, 25.0, 35.0],
+    'pages': [5.0, 15.0, 25.0],
+    'word_penalty': [2.0, 4.0, 8.0],
+    'max_lowercase_ratio': [0.25, 0.35, 0.5],
+}
+
+THRESHOLDS = np.arange(0.0, 121.0, 5.0)
+
+def span_features(span):
+    text = normalize(span.inner)
+    row = [span.start, span.end, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+    if not text or len(text) > SCORE_WEIGHTS['max_length']:
+        return row
+    row[COLUMN['valid']] = 1
+    numeric_tokens = extract_numeric_tokens(text)
+    years, pages = classify_numeric_tokens_from_text(text, numeric_tokens)
+    word_tokens = extract_word_tokens(text)
+    punct_classes = count_punctuation_classes(text)
+    row[COLUMN['latin']] = int(any(looks_like_latin_abbreviation(w) for w in word_tokens))
+    row[COLUMN['years']] = len(years)
+    row[COLUMN['pages']] = len(pages)
+    row[COLUMN['authors']] = sum(1 for w in word_tokens if looks_like_author_name(w))
+    row[COLUMN['lowercase']] = sum(1 for w in word_tokens if w[0].islower() and w.lower() not in CITATION_CONNECTIVES)
+    row[COLUMN['words']] = len(word_tokens)
+    row[COLUMN['colon']] = int('colon' in punct_classes)
+    row[COLUMN['semicolon']] = int('semicolon' in punct_classes)
+    return row
+
+def extract_feature_matrix(text):
+    spans = extract_balanced_spans(iter_paren_tokens(text), text)
+    if not spans:
+        return np.zeros((0, len(FEATURE_COLUMNS)), dtype=np.int64)
+    features = np.array([span_features(span) for span in spans], dtype=np.int64)
+    check_against_score_span(spans[:CONSISTENCY_SAMPLE], features[:CONSISTENCY_SAMPLE])
+    return features
+
+def check_against_score_span(spans, features):
+    expected = np.array([score_span(span).score for span in spans])
+    mismatched = int(np.count_nonzero(compute_scores(features, SCORE_WEIGHTS) != expected))
+    if mismatched:
+        raise RuntimeError(f"Vectorized scores disagree with score_span on {mismatched} of {len(spans)} sampled span(s)")
+
+def feature_cache_path(path):
+    return f"{path}.features-v{FEATURE_SCHEMA_VERSION}.npy"
+
+def load_feature_matrix(path):
+    cache_path = feature_cache_path(path)
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        print(f"Using cached feature matrix: {cache_path}")
+        return np.load(cache_path)
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    features = extract_feature_matrix(text)
+    np.save(cache_path, features)
+    print(f"Saved feature matrix cache: {cache_path}")
+    return features
+
+def compute_scores(features, weights):
+    col = lambda name: features[:, COLUMN[name]]
+    words = col('words')
+    lowercase = col('lowercase')
+    lowercase_ratio = np.divide(lowercase, words, out=np.zeros(len(features)), where=words > 0)
+    valid = col('valid') > 0
+    gate = (
+        valid
+        & (col('years') > 0)
+        & (lowercase_ratio <= weights['max_lowercase_ratio'])
+        & (lowercase <= weights['max_lowercase_count'])
+        & ((col('authors') > 0) | (col('pages') > 0))
+    )
+    score = (
+        weights['year']
+        + weights['author'] * (col('authors') > 0)
+        + weights['pages'] * (col('pages') > 0)
+        + weights['colon'] * col('colon')
+        + weights['semicolon'] * col('semicolon')
+        - weights['word_penalty'] * np.maximum(words - weights['free_words'], 0)
+    )
+    latin = valid & (col('latin') > 0)
+    return np.where(latin, weights['latin'], np.where(gate, score, 0.0))
+
+def count_at_or_above(scores, thresholds):
+    ordered = np.sort(scores)
+    return len(ordered) - np.searchsorted(ordered, thresholds, side='left')
+
+def load_labels(path):
+    labels = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            label, _, outer = line.partition('\t')
+            labels[normalize(outer)] = label.strip() == '1'
+    return labels
+
+def label_vector(text, features, labels):
+    result = np.full(len(features), -1, dtype=np.int8)
+    for i, (start, end) in enumerate(features[:, [COLUMN['start'], COLUMN['end']]]):
+        key = normalize(text[start:end])
+        if key in labels:
+            result[i] = int(labels[key])
+    return result
+
+def iter_weight_settings(grid):
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        weights = dict(SCORE_WEIGHTS)
+        weights.update(zip(names, values))
+        yield weights
+
+def sweep(features, thresholds, grid, labeled=None):
+    results = []
+    if labeled is not None:
+        positives = labeled == 1
+        negatives = labeled == 0
+    for weights in iter_weight_settings(grid):
+        scores = compute_scores(features, weights)
+        passed = count_at_or_above(scores, thresholds)
+        if labeled is None:
+            for threshold, count in zip(thresholds, passed):
+                results.append((weights, float(threshold), int(count), None))
+            continue
+        true_positive = count_at_or_above(scores[positives], thresholds)
+        false_positive = count_at_or_above(scores[negatives], thresholds)
+        total_positive = int(positives.sum())
+        for threshold, count, tp, fp in zip(thresholds, passed, true_positive, false_positive):
+            precision = tp / (tp + fp) if tp + fp else 0.0
+            recall = tp / total_positive if total_positive else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            results.append((weights, float(threshold), int(count), (precision, recall, f1)))
+    return results
+
+def describe_weights(weights):
+    return ', '.join(f'{name}={weights[name]}' for name in WEIGHT_GRID)
+
+def main():
+    path = input('Input file (input.txt): ') or 'input.txt'
+    labels_path = input('Labeled sample, tab-separated "1|0<TAB>(span)" lines (Enter to skip): ').strip()
+    features = load_feature_matrix(path)
+    print(f"Extracted features for {len(features)} parenthesized span(s).")
+    labeled = None
+    if labels_path:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        labeled = label_vector(text, features, load_labels(labels_path))
+        print(f"Matched {int((labeled >= 0).sum())} labeled span(s).")
+    grid = WEIGHT_GRID if '--grid' in sys.argv else {}
+    results = sweep(features, THRESHOLDS, grid, labeled)
+    if labeled is not None:
+        results.sort(key=lambda r: r[3][2], reverse=True)
+        for weights, threshold, count, (precision, recall, f1) in results[:20]:
+            print(f"  threshold={threshold:.1f} passed={count} precision={precision:.2f} recall={recall:.2f} f1={f1:.2f} | {describe_weights(weights)}")
+        if results:
+            weights_path = path + '.weights.json'
+            with open(weights_path, 'w', encoding='utf-8') as f:
+                json.dump(results[0][0], f, indent=2)
+            print(f"Best weights saved to {weights_path} (use remove_citations.py --weights={weights_path} --threshold={results[0][1]:.1f})")
+        return
+    for weights, threshold, count, _ in results:
+        print(f"  threshold={threshold:.1f} passed={count} | {describe_weights(weights)}")
+
+if __name__ == '__main__':
+    main()